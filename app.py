@@ -6,9 +6,14 @@ import os
 import sys
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 from datetime import datetime
 import hashlib
+import itertools
+import threading
+import uuid
+from collections import OrderedDict, deque
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from backend.file_classifier import classify_files_batch
@@ -18,88 +23,31 @@ from backend.file_classifier import classify_files_batch
 st.set_page_config(page_title="C.I.A. - Content Intelligence Analyzer", layout="wide")
 
 # --- SESSION STATE ---
+MAX_RESULTS = 10_000  # oldest results are dropped beyond this (see record_result)
+
 if "results" not in st.session_state:
-    st.session_state.results = []
+    st.session_state.results = deque()
+if "flagged" not in st.session_state:
+    st.session_state.flagged = deque()
+if "safe" not in st.session_state:
+    st.session_state.safe = deque()
+if "seen_uploads" not in st.session_state:
+    st.session_state.seen_uploads = set()
 if "page_number" not in st.session_state:
     st.session_state.page_number = {}
+if "page_keys" not in st.session_state:
+    st.session_state.page_keys = {}
 
 
 # --- CUSTOM CSS ---
-st.markdown("""
-<style>
-body {
-    background-color: #0b0e17;
-    color: #e3e6ed;
-    font-family: 'Inter', sans-serif;
-}
-.sidebar .sidebar-content {
-    background: linear-gradient(180deg, #171a24 0%, #0d0f17 100%);
-    padding: 24px;
-}
-h1, h2, h3, h4 {
-    color: #b9aaff !important;
-    font-weight: 700;
-}
-.metric-card {
-    background-color: #181c29;
-    padding: 22px;
-    border-radius: 10px;
-    text-align: center;
-    box-shadow: 0px 0px 12px rgba(185,170,255,0.08);
-}
-.metric-value {
-    font-size: 34px;
-    color: #b9aaff;
-    font-weight: 700;
-}
-.metric-label {
-    font-size: 14px;
-    color: #b0b3c1;
-}
-.stButton > button {
-    background: linear-gradient(90deg, #4d3fff, #7d6aff);
-    color: white;
-    border-radius: 6px;
-    border: none;
-    font-weight: 600;
-    box-shadow: 0 2px 6px rgba(125,106,255,0.4);
-}
-.stButton > button:hover {
-    background: linear-gradient(90deg, #695aff, #8e7aff);
-}
-.sidebar-title {
-    font-size: 18px;
-    color: #b9aaff;
-    font-weight: 700;
-    text-transform: uppercase;
-    letter-spacing: 0.8px;
-    margin-bottom: 20px;
-}
-.sidebar-section {
-    color: #d1d5e0;
-    font-size: 15px;
-    margin-top: 18px;
-}
-hr {
-    border: 0;
-    border-top: 1px solid #2a2f40;
-    margin: 18px 0;
-}
-.status-light {
-    height: 10px;
-    width: 10px;
-    border-radius: 50%;
-    display: inline-block;
-    margin-right: 8px;
-    background-color: #4ade80;
-    box-shadow: 0 0 6px rgba(74, 222, 128, 0.5);
-}
-.pagination {
-    text-align: center;
-    margin-top: 20px;
-}
-</style>
-""", unsafe_allow_html=True)
+@st.cache_data(show_spinner=False)
+def load_css():
+    """Read the app stylesheet once; reruns reuse the cached string."""
+    with open(os.path.join(os.path.dirname(__file__), "static", "app.css"), encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
+
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 
 # --- SIDEBAR ---
@@ -119,19 +67,85 @@ st.sidebar.markdown("<hr>", unsafe_allow_html=True)
 st.sidebar.caption("NCAT Hackathon 2025 | Four Horse Men")
 
 
+# --- CLASSIFICATION CACHE ---
+CLASSIFY_CACHE_SIZE = 1_000  # per-file results kept across reruns and sessions
+
+
+@st.cache_resource
+def classification_cache():
+    """Process-wide LRU of per-file results keyed on (file name, content hash), with its lock."""
+    return OrderedDict(), threading.Lock()
+
+
+def cached_classify(paths: list, content_hashes: list) -> list:
+    """Classify saved uploads, reusing results for files with identical name and content.
+
+    Only the cache misses are sent to ``classify_files_batch``, together in one batch.
+    Returns one fresh copy per path, in order, stamped with the current time and
+    its own uid (cached results may come from another upload or session).
+    """
+    cache, lock = classification_cache()
+    keys = [(os.path.basename(path), h) for path, h in zip(paths, content_hashes)]
+    found = {}
+    with lock:
+        for key in keys:
+            if key in cache:
+                cache.move_to_end(key)
+                found[key] = cache[key]
+
+    misses = {key: path for key, path in zip(keys, paths) if key not in found}
+    if misses:
+        by_name = {r["file_name"]: r for r in classify_files_batch(list(misses.values()))}
+        with lock:
+            for key in misses:
+                found[key] = by_name[key[0]]
+                # Failed analyses are not cached so a later upload retries them
+                if found[key]["mime_type"] != "error":
+                    cache[key] = found[key]
+            while len(cache) > CLASSIFY_CACHE_SIZE:
+                cache.popitem(last=False)
+
+    uploaded = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return [dict(found[key], uploaded=uploaded, uid=uuid.uuid4().hex) for key in keys]
+
+
 # --- FILE HANDLER ---
+def record_result(r):
+    """Append a result to the session, evicting the oldest one once MAX_RESULTS is reached."""
+    state = st.session_state
+    if len(state.results) >= MAX_RESULTS:
+        oldest = state.results.popleft()
+        # Partitions are filled in the same order, so the oldest result is also first in its partition
+        (state.flagged if oldest.get("flagged") else state.safe).popleft()
+    state.results.append(r)
+    (state.flagged if r.get("flagged") else state.safe).append(r)
+
+
 def handle_uploads(uploaded_files):
+    """Analyze uploads not yet recorded this session and return only the newly recorded results."""
     os.makedirs("uploads", exist_ok=True)
     paths = []
+    content_hashes = []
     for f in uploaded_files:
+        # The uploader resubmits every file it holds on each rerun; analyze and record
+        # each upload once. A deliberate re-upload gets a new file_id and is recorded again.
+        if f.file_id in st.session_state.seen_uploads:
+            continue
         path = os.path.join("uploads", f.name)
+        data = f.getbuffer()
+        content_hashes.append(hashlib.blake2b(data).hexdigest())
         with open(path, "wb") as out:
-            out.write(f.getbuffer())
+            out.write(data)
         paths.append(path)
 
-    st.info("Analyzing files with Magika AI... please wait ⏳")
-    new_results = classify_files_batch(paths)
-    st.session_state.results.extend(new_results)
+    new_results = []
+    if paths:
+        st.info("Analyzing files with Magika AI... please wait ⏳")
+        new_results = cached_classify(paths, content_hashes)
+        for r in new_results:
+            record_result(r)
+    # Only files still in the uploader can be resubmitted, so that bounds the set
+    st.session_state.seen_uploads = {f.file_id for f in uploaded_files}
     return new_results
 
 
@@ -145,7 +159,14 @@ def paginate_data(data, namespace: str, items_per_page=10):
     current_page = st.session_state.page_number[namespace]
     start_idx = current_page * items_per_page
     end_idx = start_idx + items_per_page
-    paginated_data = data[start_idx:end_idx]
+    paginated_data = list(itertools.islice(data, start_idx, end_idx))
+
+    # Button keys are built once per page and reused on later reruns
+    page_keys = st.session_state.page_keys.setdefault(namespace, [])
+    page_keys.extend(
+        (f"{namespace}_prev_{i}", f"{namespace}_next_{i}") for i in range(len(page_keys), total_pages)
+    )
+    prev_key, next_key = page_keys[current_page]
 
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
@@ -155,12 +176,12 @@ def paginate_data(data, namespace: str, items_per_page=10):
         )
         col_a, col_b = st.columns(2)
         with col_a:
-            if st.button("⬅ Previous", key=f"{namespace}_prev_{current_page}"):
+            if st.button("⬅ Previous", key=prev_key):
                 if st.session_state.page_number[namespace] > 0:
                     st.session_state.page_number[namespace] -= 1
                     st.rerun()
         with col_b:
-            if st.button("Next ➡", key=f"{namespace}_next_{current_page}"):
+            if st.button("Next ➡", key=next_key):
                 if st.session_state.page_number[namespace] < total_pages - 1:
                     st.session_state.page_number[namespace] += 1
                     st.rerun()
@@ -172,8 +193,8 @@ if page == "Dashboard":
     st.markdown("<h1 style='text-align:center;'>C.I.A - Content Intelligence Analyzer</h1>", unsafe_allow_html=True)
 
     total = len(st.session_state.results)
-    flagged = sum(1 for r in st.session_state.results if r.get("flagged"))
-    safe = total - flagged
+    flagged = len(st.session_state.flagged)
+    safe = len(st.session_state.safe)
 
     col1, col2, col3, col4 = st.columns(4)
     col1.markdown(f'<div class="metric-card"><div class="metric-value">{total}</div><div class="metric-label">Total Files Scanned</div></div>', unsafe_allow_html=True)
@@ -185,20 +206,21 @@ if page == "Dashboard":
     st.subheader("Live File Feed")
 
     if total > 0:
-        df = pd.DataFrame(st.session_state.results)
-        df["AI Confidence"] = df["confidence"]
-        df["Status"] = df["flagged"].map(lambda x: "Leak Risk" if x else "Safe")
-        df = df.rename(columns={
-            "file_name": "File Name",
-            "language": "Language",
-            "ai_category": "AI Category",
-            "uploaded": "Timestamp"
+        # Only the rows on the current page are turned into a DataFrame
+        page_results = paginate_data(st.session_state.results, "dashboard")
+        names, categories, languages, flags, confidences, timestamps = zip(*(
+            (r["file_name"], r["ai_category"], r["language"], r["flagged"], r["confidence"], r["uploaded"])
+            for r in page_results
+        ))
+        df = pd.DataFrame({
+            "File Name": names,
+            "AI Category": categories,
+            "Language": languages,
+            "Status": np.where(flags, "Leak Risk", "Safe"),
+            "AI Confidence": confidences,
+            "Timestamp": timestamps,
         })
-        paginated_df = paginate_data(df, "dashboard")
-        st.dataframe(
-            paginated_df[["File Name", "AI Category", "Language", "Status", "AI Confidence", "Timestamp"]],
-            use_container_width=True
-        )
+        st.dataframe(df, use_container_width=True)
     else:
         st.info("No data yet. Upload files in File Analysis to populate the dashboard.")
 
@@ -210,10 +232,11 @@ elif page == "File Analysis":
 
     if uploaded_files:
         new_results = handle_uploads(uploaded_files)
-        st.success(f"{len(new_results)} files analyzed successfully.")
+        if new_results:
+            st.success(f"{len(new_results)} files analyzed successfully.")
 
-    flagged_files = [r for r in st.session_state.results if r.get("flagged")]
-    safe_files = [r for r in st.session_state.results if not r.get("flagged")]
+    flagged_files = st.session_state.flagged
+    safe_files = st.session_state.safe
 
     if len(st.session_state.results) == 0:
         st.info("No files analyzed yet. Upload files to begin.")
@@ -225,7 +248,6 @@ elif page == "File Analysis":
             st.success("No leaks detected.")
         else:
             for r in paginate_data(flagged_files, "flagged"):
-                unique_key = hashlib.md5(f"{r.get('file_name','')}_{r.get('uploaded','')}_flagged".encode()).hexdigest()
                 with st.expander(f"{r.get('file_name', 'Unknown')} — Potential Leak"):
                     st.write(f"**AI Category:** {r.get('ai_category', 'Unknown')}")
                     st.write(f"**MIME Type:** {r.get('mime_type', 'Unknown')}")
@@ -237,14 +259,13 @@ elif page == "File Analysis":
                         f"Preview - {r.get('file_name', 'Unknown')}",
                         r.get("preview", "No preview available."),
                         height=180,
-                        key=f"text_{unique_key}"
+                        key=f"text_{r['uid']}"
                     )
 
         st.markdown("---")
         st.subheader("Safe Files")
 
         for r in paginate_data(safe_files, "safe"):
-            unique_key = hashlib.md5(f"{r.get('file_name','')}_{r.get('uploaded','')}_safe".encode()).hexdigest()
             with st.expander(f"{r.get('file_name', 'Unknown')} — Safe File"):
                 st.write(f"**AI Category:** {r.get('ai_category', 'Unknown')}")
                 st.write(f"**MIME Type:** {r.get('mime_type', 'Unknown')}")
@@ -255,19 +276,18 @@ elif page == "File Analysis":
                     f"Preview - {r.get('file_name', 'Unknown')}",
                     r.get("preview", "No preview available."),
                     height=150,
-                    key=f"text_{unique_key}"
+                    key=f"text_{r['uid']}"
                 )
 
 
 # --- QUARANTINE ---
 elif page == "Quarantine":
     st.markdown("<h1 style='text-align:center;'>Quarantine</h1>", unsafe_allow_html=True)
-    flagged_files = [r for r in st.session_state.results if r.get("flagged")]
+    flagged_files = st.session_state.flagged
     if not flagged_files:
         st.success("No files currently quarantined.")
     else:
         for r in paginate_data(flagged_files, "quarantine"):
-            unique_key = hashlib.md5(f"{r.get('file_name','')}_{r.get('uploaded','')}_quarantine".encode()).hexdigest()
             with st.expander(f"{r.get('file_name', 'Unknown')} — Quarantined"):
                 st.write(f"**Uploaded:** {r.get('uploaded', 'Unknown')}")
                 st.write(f"**Language:** {r.get('language', 'Unknown')}")
@@ -277,5 +297,5 @@ elif page == "Quarantine":
                     f"Preview - {r.get('file_name', 'Unknown')}",
                     r.get("preview", "No preview available."),
                     height=180,
-                    key=f"text_{unique_key}"
+                    key=f"text_{r['uid']}"
                 )
@@ -1,13 +1,28 @@
 import os
 import re
+import codecs
+import functools
+import mmap
 import mimetypes
 from datetime import datetime
+import threading
+import uuid
 import concurrent.futures
 import chardet
 from langdetect import detect_langs
+from langdetect.detector_factory import init_factory as init_langdetect
 from langcodes import Language
 from magika import Magika  # AI-powered file classification
 
+try:
+    import hyperscan  # Optional SIMD multi-pattern matcher for the PII scan
+except ImportError:
+    hyperscan = None
+
+# Shared Magika model, loaded lazily and reused across files (and threads)
+_MAGIKA = None
+_MAGIKA_LOCK = threading.Lock()
+
 
 # ----------------------------
 #   PII Detection Patterns
@@ -28,14 +43,115 @@ PII_PATTERNS = {
     "spanish_cc_label": re.compile(r"\b(tarjeta|numero de tarjeta|número de tarjeta)\b", re.I),
     "spanish_ssn_label": re.compile(r"\b(NSS|dni|cedula|rut)\b", re.I),
     "student_id": re.compile(r"\b(?:S\d{5,9}|ID[:\s]?\d{5,9})\b", re.I),
+    # Extra contextual patterns
+    "person_name": re.compile(r"\b[A-Z][a-z]+ [A-Z][a-z]+\b"),
+    "address": re.compile(r"\b\d{1,5}\s[A-Za-z0-9\s]+(Street|St|Ave|Avenue|Blvd|Road|Rd|Lane|Ln)\b"),
+    "bank_account": re.compile(r"\b\d{9,18}\b"),
+}
+
+
+# The PII scan runs on bytes (bytes-mode re, or Hyperscan without UTF-8
+# mode), so PII_PATTERNS are matched byte-wise, not as Unicode text:
+#   - \b, \w, \d and \s are ASCII-only. Non-ASCII letters count as non-word
+#     characters, which adds matches such as password_label in "éclave" or
+#     student_id in "caféS12345"; non-ASCII digits and spaces never match.
+#   - re.I folds ASCII letters only, and the non-ASCII keywords (contraseña,
+#     número) do not match files that fall back to latin-1.
+# UTF-8 and latin-1 files are scanned as raw bytes. UTF-16/32 files (by BOM)
+# and chardet-decoded files are scanned as their text re-encoded to UTF-8.
+def _build_hyperscan_db(patterns: dict):
+    """Compile the patterns into a Hyperscan database, or return None if unavailable."""
+    if hyperscan is None:
+        return None
+    # Byte-level matching, the same as the bytes regex fallback; raw file data may not be valid UTF-8
+    base_flags = hyperscan.HS_FLAG_SINGLEMATCH
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[p.pattern.encode("utf-8") for p in patterns.values()],
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=[base_flags | (hyperscan.HS_FLAG_CASELESS if p.flags & re.I else 0) for p in patterns.values()],
+        )
+        return db
+    except Exception:
+        return None
+
+
+# Patterns that cannot match unless the data contains a digit / an "@"
+DIGIT_PII_KEYS = {"ssn_us", "credit_card", "ip_v4", "phone", "dob", "student_id", "address", "bank_account"}
+AT_SIGN_PII_KEYS = {"email"}
+_DIGIT_BYTES = [bytes([c]) for c in b"0123456789"]
+
+
+def _prefiltered_keys(has_digit: bool, has_at_sign: bool) -> tuple:
+    """Return the PII keys that can match given which marker characters are present."""
+    return tuple(
+        key for key in PII_PATTERNS
+        if (has_digit or key not in DIGIT_PII_KEYS) and (has_at_sign or key not in AT_SIGN_PII_KEYS)
+    )
+
+
+# Candidate PII keys for the regex fallback, keyed by (has_digit, has_at_sign)
+PREFILTERED_PII_KEYS = {
+    (has_digit, has_at_sign): _prefiltered_keys(has_digit, has_at_sign)
+    for has_digit in (True, False)
+    for has_at_sign in (True, False)
 }
+PII_KEYS = list(PII_PATTERNS)
+
+# Individual bytes patterns searched by the regex fallback
+BYTES_PII_PATTERNS = {
+    key: re.compile(pattern.pattern.encode("utf-8"), pattern.flags & re.I)
+    for key, pattern in PII_PATTERNS.items()
+}
+HYPERSCAN_DB = _build_hyperscan_db(PII_PATTERNS)
+
+# Hyperscan scratch space cannot be shared between concurrent scans
+_hs_local = threading.local()
+
+# Byte-order marks of encodings that are not ASCII-compatible; UTF-32 comes
+# first because its little-endian BOM starts with the UTF-16 one
+WIDE_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# Encodings whose raw bytes the PII patterns can be run on directly
+RAW_SCAN_ENCODINGS = {"utf-8", "latin-1"}
+
+# Language detection only needs the start of the preview; plain ASCII text
+# containing these words is treated as English without running langdetect
+LANGUAGE_SAMPLE_CHARS = 2000
+ENGLISH_MARKERS = (" the ", " and ", " is ")
 
 
 # ----------------------------
 #   Helper Functions
 # ----------------------------
+def init_magika():
+    """Load the Magika model once and return the shared instance."""
+    global _MAGIKA
+    if _MAGIKA is None:
+        with _MAGIKA_LOCK:
+            if _MAGIKA is None:
+                _MAGIKA = Magika()
+    return _MAGIKA
+
+
 def detect_language(text: str) -> str:
     """Detect dominant language for text preview."""
+    sample = text[:LANGUAGE_SAMPLE_CHARS]
+    lowered = sample.lower()
+    if sample.isascii() and any(word in lowered for word in ENGLISH_MARKERS):
+        return "English (en)"
+    return _detect_language_cached(sample)
+
+
+@functools.lru_cache(maxsize=1024)
+def _detect_language_cached(text: str) -> str:
+    """Run langdetect on a text sample, memoized for repeated uploads."""
     try:
         langs = detect_langs(text)
         if not langs:
@@ -48,38 +164,128 @@ def detect_language(text: str) -> str:
         return "Unknown"
 
 
-def safe_read(file_path: str, max_bytes: int = 20000):
-    """Safely read partial file data to avoid large memory use."""
+def decode_preview(raw, detect_encoding: bool = False):
+    """Decode raw file bytes as UTF-8, falling back to latin-1.
+
+    Files starting with a UTF-16/32 BOM are decoded accordingly. Set
+    ``detect_encoding`` to run the much slower chardet detection instead.
+    """
+    for bom, enc in WIDE_BOMS:
+        if raw[:len(bom)] == bom:
+            return codecs.getincrementaldecoder(enc)(errors="ignore").decode(raw, final=False), enc
+    if detect_encoding:
+        enc = chardet.detect(bytes(raw)).get("encoding") or "utf-8"
+        return str(raw, enc, errors="ignore"), enc
+    try:
+        # Incremental decode tolerates a multi-byte character cut off at the read limit
+        return codecs.getincrementaldecoder("utf-8")().decode(raw, final=False), "utf-8"
+    except UnicodeDecodeError:
+        return str(raw, "latin-1"), "latin-1"
+
+
+def _hyperscan_scratch():
+    """Return the Hyperscan scratch space owned by the current thread."""
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None:
+        scratch = _hs_local.scratch = hyperscan.Scratch(HYPERSCAN_DB)
+    return scratch
+
+
+def find_pii_bytes(data) -> list:
+    """Search raw bytes (or any buffer) for PII-like patterns.
+
+    Uses Hyperscan (one pass for all patterns) if installed, else one regex
+    search per pattern that can still match.
+    """
+    if HYPERSCAN_DB is not None:
+        hits = set()
+
+        def on_match(pattern_id, start, end, flags, context):
+            hits.add(pattern_id)
+
+        HYPERSCAN_DB.scan(data, match_event_handler=on_match, scratch=_hyperscan_scratch())
+        return [key for i, key in enumerate(PII_KEYS) if i in hits]
+
+    # Cheap byte searches rule out patterns that need a digit or an "@"; each
+    # remaining pattern stops at its first match, and overlapping labels are
+    # all reported, as with Hyperscan
+    has_digit = any(data.find(digit) != -1 for digit in _DIGIT_BYTES)
+    has_at_sign = data.find(b"@") != -1
+    candidates = PREFILTERED_PII_KEYS[has_digit, has_at_sign]
+    return [key for key in candidates if BYTES_PII_PATTERNS[key].search(data)]
+
+
+def scan_head(head, detect_encoding: bool = False) -> tuple:
+    """Scan already-read file bytes for PII and decode them for the preview."""
+    preview, encoding = decode_preview(head, detect_encoding)
+    if encoding in RAW_SCAN_ENCODINGS:
+        pii_matches = find_pii_bytes(head)
+    else:
+        # UTF-16/32 or a chardet-detected encoding may not keep ASCII bytes as-is
+        pii_matches = find_pii_bytes(preview.encode("utf-8"))
+    return preview, encoding, pii_matches
+
+
+def scan_file_head(file_path: str, max_bytes: int = 20000, file_size: int = None, detect_encoding: bool = False):
+    """Scan the start of a file for PII and decode it for the preview.
+
+    The PII scan runs directly on a read-only memory map of the file; only
+    the preview shown in the UI is decoded to text. Pass ``file_size`` if the
+    caller already has it to skip another stat.
+    """
+    # Only reading the file is treated as "unreadable"; scanner errors must reach
+    # the caller rather than letting the file pass as safe with no PII found
     try:
         with open(file_path, "rb") as f:
-            raw = f.read(max_bytes)
-        enc = chardet.detect(raw).get("encoding") or "utf-8"
-        text = raw.decode(enc, errors="ignore")
-        return text, enc
-    except Exception:
-        return "[Unreadable or binary data]", "Unknown"
+            if file_size is None:
+                file_size = os.fstat(f.fileno()).st_size
+            length = min(file_size, max_bytes)
+            # The mapping stays valid after the file object is closed
+            mm = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) if length else None
+    except (OSError, ValueError):
+        return "[Unreadable or binary data]", "Unknown", []
+
+    if mm is None:
+        return "", "utf-8", []
+    with mm:
+        return scan_head(mm, detect_encoding)
 
 
-def find_pii(preview_text: str) -> list:
-    """Search text for PII-like patterns."""
-    found = []
-    for key, pattern in PII_PATTERNS.items():
-        if pattern.search(preview_text):
-            found.append(key)
-    return found
+def identify_file(file_path: str, max_bytes: int = 20000):
+    """Run Magika on one file and return its result with the first ``max_bytes`` read.
+
+    This is the per-file fallback, used by direct ``analyze_single_file`` calls
+    and when the batched ``identify_paths`` call fails. Files that fit in
+    ``max_bytes`` are read once and classified from that buffer. Larger files
+    are still read twice, because ``identify_path`` also samples their end.
+    The batch path deliberately does not use this (see ``classify_files_batch``).
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(max_bytes + 1)
+    if len(head) <= max_bytes:
+        return init_magika().identify_bytes(head), head
+    return init_magika().identify_path(file_path), head[:max_bytes]
 
 
 # ----------------------------
 #   File Analyzer
 # ----------------------------
-def analyze_single_file(file_path: str) -> dict:
-    """Analyze one file with Magika AI + PII scanning."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def analyze_single_file(file_path: str, ai_result=None, timestamp: str = None, detect_encoding: bool = False) -> dict:
+    """Analyze one file with Magika AI + PII scanning.
+
+    When the batch processor already ran Magika over this file, its result is
+    passed in as ``ai_result`` and the model is not invoked again. The batch
+    also passes one shared ``timestamp`` for all of its files. Set
+    ``detect_encoding`` to decode the preview with chardet detection.
+    """
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    file_name = os.path.basename(file_path)
 
+    head = None
     try:
-        # Initialize Magika within this process
-        magika = Magika()
-        ai_result = magika.identify_path(file_path)
+        if ai_result is None:
+            ai_result, head = identify_file(file_path)
         output = ai_result.output
 
         mime = getattr(output, "mime_type", None) or mimetypes.guess_type(file_path)[0] or "application/octet-stream"
@@ -87,7 +293,7 @@ def analyze_single_file(file_path: str) -> dict:
         confidence = getattr(output, "confidence", 0.99) * 100
     except Exception as e:
         return {
-            "file_name": os.path.basename(file_path),
+            "file_name": file_name,
             "mime_type": "error",
             "ai_category": "Processing Failed",
             "confidence": "0%",
@@ -97,9 +303,13 @@ def analyze_single_file(file_path: str) -> dict:
             "flag_reasons": [f"Magika error: {str(e)}"],
             "preview": "[Error analyzing file]",
             "uploaded": timestamp,
+            "uid": uuid.uuid4().hex,
         }
 
-    ext = os.path.splitext(file_path)[1].lower()
+    # One stat for the size; the extension comes from the name already computed
+    file_size = os.stat(file_path).st_size
+    dot = file_name.rfind(".")
+    ext = file_name[dot:].lower() if dot > 0 else ""
 
     flagged = False
     flag_reasons = []
@@ -109,50 +319,67 @@ def analyze_single_file(file_path: str) -> dict:
 
     # Only analyze readable files (TXT or PDF)
     if mime in ["application/pdf", "text/plain"] or ext in [".pdf", ".txt"]:
-        preview, encoding = safe_read(file_path)
+        if head is None:
+            preview, encoding, pii_matches = scan_file_head(
+                file_path, file_size=file_size, detect_encoding=detect_encoding
+            )
+        else:
+            preview, encoding, pii_matches = scan_head(head, detect_encoding)
         language = detect_language(preview)
-        pii_matches = find_pii(preview)
-
-        # Extra contextual patterns
-        personal_info_patterns = {
-            "person_name": r"\b[A-Z][a-z]+ [A-Z][a-z]+\b",
-            "address": r"\b\d{1,5}\s[A-Za-z0-9\s]+(Street|St|Ave|Avenue|Blvd|Road|Rd|Lane|Ln)\b",
-            "bank_account": r"\b\d{9,18}\b",
-        }
-
-        for label, pattern in personal_info_patterns.items():
-            if re.search(pattern, preview):
-                pii_matches.append(label)
 
         if pii_matches:
             flagged = True
-            flag_reasons = list(set(pii_matches))
+            flag_reasons = pii_matches
 
     return {
-        "file_name": os.path.basename(file_path),
+        "file_name": file_name,
         "mime_type": mime,
         "ai_category": category,
         "file_type": ext.lstrip(".") or "unknown",
         "encoding": encoding,
         "language": language,
-        "file_size": f"{os.path.getsize(file_path)} bytes",
+        "file_size": f"{file_size} bytes",
         "confidence": f"{confidence:.2f}%",
         "uploaded": timestamp,
         "preview": preview[:5000].strip(),
         "flagged": flagged,
         "flag_reasons": flag_reasons,
+        "uid": uuid.uuid4().hex,
     }
 
 
 # ----------------------------
 #   Scalable Batch Processor
 # ----------------------------
-def classify_files_batch(file_paths: list) -> list:
-    """Process multiple files concurrently using ProcessPoolExecutor for CPU-bound operations."""
+def classify_files_batch(file_paths: list, detect_encoding: bool = False) -> list:
+    """Classify all files in one batched Magika call, then scan them for PII in threads."""
     results = []
+    batch_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # langdetect loads its profiles lazily and not thread-safely; load them before
+    # the workers start so no thread sees a half-initialized profile set
+    try:
+        init_langdetect()
+    except Exception:
+        pass  # detect_language reports "Unknown"
+
+    # Magika batches inference across files (loading the shared model first);
+    # fall back to per-file calls if it fails. This reads each file's start and
+    # end inside Magika, and the workers then map the head again for the PII
+    # scan: Magika has no batched API for in-memory bytes, and the second read
+    # is served from the page cache, so batching wins over a single read here.
+    try:
+        ai_results = init_magika().identify_paths(file_paths)
+    except Exception:
+        ai_results = [None] * len(file_paths)
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        future_to_path = {executor.submit(analyze_single_file, path): path for path in file_paths}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        future_to_path = {
+            executor.submit(
+                analyze_single_file, path, ai_result, timestamp=batch_timestamp, detect_encoding=detect_encoding
+            ): path
+            for path, ai_result in zip(file_paths, ai_results)
+        }
 
         for future in concurrent.futures.as_completed(future_to_path):
             path = future_to_path[future]
@@ -169,7 +396,8 @@ def classify_files_batch(file_paths: list) -> list:
                     "flagged": False,
                     "flag_reasons": [f"Worker error: {str(e)}"],
                     "preview": "[Error analyzing file]",
-                    "uploaded": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "uploaded": batch_timestamp,
+                    "uid": uuid.uuid4().hex,
                 })
 
     return results